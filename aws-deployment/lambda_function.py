@@ -6,7 +6,11 @@ Enhanced with Smart Price Analysis and Web API Support
 import json
 import boto3
 import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+from urllib3.util.request import ACCEPT_ENCODING
 from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+import soupsieve
 import re
 import time
 import logging
@@ -16,7 +20,14 @@ from urllib.parse import urlparse
 import os
 import random
 import statistics
-from collections import defaultdict
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Prefer the C-based lxml parser; fall back to the pure-Python one if bs4 could
+# not register it (lxml missing, or its compiled etree broken for this platform)
+HTML_PARSER = 'lxml' if builder_registry.lookup('lxml') else 'html.parser'
 
 # Configure logging
 logger = logging.getLogger()
@@ -28,11 +39,116 @@ sns = boto3.client('sns')
 ssm = boto3.client('ssm')
 cloudwatch = boto3.client('cloudwatch')
 
+# Number of product pages fetched in parallel per tracking run
+MAX_FETCH_WORKERS = int(os.environ.get('MAX_FETCH_WORKERS', '4'))
+
+# Largest decoded page body the extractors will parse
+MAX_PAGE_BYTES = 10 * 1024 * 1024
+
 # DynamoDB tables
 products_table = dynamodb.Table('PriceTrackerProducts')
 history_table = dynamodb.Table('PriceTrackerHistory')
 alerts_table = dynamodb.Table('PriceTrackerAlerts')
 
+# Class-name keywords that mark price elements on generic pages, in priority order
+PRICE_CLASS_KEYWORDS = ('price', 'cost', 'amount', 'value', 'total')
+PRICE_CLASS_RE = re.compile('|'.join(PRICE_CLASS_KEYWORDS), re.I)
+
+# Site price selectors in priority order, compiled once at import so each page
+# lookup skips CSS parsing
+AMAZON_MOBILE_PRICE_SELECTORS = tuple(soupsieve.compile(selector) for selector in [
+    '.a-price-whole',
+    '#price_inside_buybox',
+    '.a-price .a-offscreen'
+])
+AMAZON_PRICE_SELECTORS = tuple(soupsieve.compile(selector) for selector in [
+    '.a-price.a-text-price.a-size-medium.apexPriceToPay .a-offscreen',
+    '.a-price .a-offscreen',
+    '.a-price-whole',
+    '#price_inside_buybox',
+    '.a-price-range .a-offscreen',
+    '#apex_desktop .a-price .a-offscreen',
+    '.a-price-symbol + .a-price-whole',
+    '.a-price.a-text-price .a-offscreen',
+    '.a-offscreen',
+    '.a-price-current',
+    '[data-asin-price]',
+    '.a-price.a-text-price.a-size-medium.apexPriceToPay',
+    '.buybox-price',
+    '.header-price'
+])
+EBAY_PRICE_SELECTORS = tuple(soupsieve.compile(selector) for selector in [
+    '.mainPrice .price',
+    '.u-flL .price',
+    '.notranslate',
+    '.display-price'
+])
+
+# Price regexes, compiled once at import instead of on every extraction
+AMAZON_TEXT_PRICE_PATTERNS = (
+    re.compile(r'£[\d,]+\.?\d*'),
+    re.compile(r'GBP\s*[\d,]+\.?\d*'),
+    re.compile(r'Price:\s*£([\d,]+\.?\d*)')
+)
+CURRENCY_PRICE_RE = re.compile(r'[£$€¥₹]\s*[\d,]+\.?\d*')
+# First number in a price string: digit groups split by (non-breaking/thin)
+# spaces as in '1 299,99 €', plain digits with separators, or a bare '.99'
+PRICE_NUMBER_RE = re.compile(
+    r'\d{1,3}(?:[ \u00a0\u202f]\d{3})+(?:[.,]\d+)?(?!\d)'
+    r'|\d[\d.,]*'
+    r'|\.\d+'
+)
+
+# CORS headers shared by every web API response
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS'
+}
+
+# SNS alert body; the static text is built once at import and filled per alert
+ALERT_MESSAGE_TEMPLATE = """
+Price Alert!
+
+Product ID: {product_id}
+Previous Price: £{previous_price:.2f}
+Current Price: £{current_price:.2f}
+Change: {change_percent:.1f}%
+Alert Type: {alert_type}
+
+This is an automated alert from your Price Tracker.
+"""
+
+# Domain substrings and the platform they identify, checked in order
+PLATFORM_DOMAINS = (
+    ('amazon', 'amazon'),
+    ('ebay', 'ebay')
+)
+
+@lru_cache(maxsize=1024)
+def detect_platform(domain):
+    """Map a lower-cased domain to a supported platform, or 'generic'"""
+    for needle, platform in PLATFORM_DOMAINS:
+        if needle in domain:
+            return platform
+    return 'generic'
+
+def query_price_history(product_id, days=30, **query_kwargs):
+    """History items for a product from the last N days, oldest first"""
+    cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    
+    # The cutoff is on the sort key, so DynamoDB reads only the window
+    # instead of the whole product partition before filtering
+    response = history_table.query(
+        KeyConditionExpression=(
+            boto3.dynamodb.conditions.Key('product_id').eq(product_id)
+            & boto3.dynamodb.conditions.Key('timestamp').gte(cutoff_date)
+        ),
+        ScanIndexForward=True,  # Sort by timestamp ascending
+        **query_kwargs
+    )
+    return response.get('Items', [])
+
 class PriceAnalyzer:
     """Smart price analysis and predictions"""
     
@@ -42,28 +158,25 @@ class PriceAnalyzer:
     def analyze_price_history(self, product_id, days=30):
         """Analyze price history and generate insights"""
         try:
-            # Get price history for the last N days
-            cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-            
-            response = history_table.query(
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('product_id').eq(product_id),
-                FilterExpression=boto3.dynamodb.conditions.Attr('timestamp').gte(cutoff_date),
-                ScanIndexForward=True  # Sort by timestamp ascending
+            # Get price history for the last N days; analysis only reads these
+            # two attributes, so skip url/ttl/change fields
+            items = query_price_history(
+                product_id, days,
+                ProjectionExpression='#ts, price',
+                ExpressionAttributeNames={'#ts': 'timestamp'}
             )
-            
-            items = response.get('Items', [])
             if len(items) < 2:
                 return self._default_analysis()
             
             prices = [float(item['price']) for item in items]
-            timestamps = [item['timestamp'] for item in items]
+            avg_price = statistics.fmean(prices)
             
             analysis = {
                 'current_price': prices[-1],
                 'min_price': min(prices),
                 'max_price': max(prices),
-                'avg_price': statistics.mean(prices),
-                'price_volatility': statistics.stdev(prices) if len(prices) > 1 else 0,
+                'avg_price': avg_price,
+                'price_volatility': statistics.stdev(prices, avg_price) if len(prices) > 1 else 0,
                 'price_trend': self._calculate_trend(prices),
                 'days_analyzed': len(items),
                 'price_changes': self._analyze_price_changes(items),
@@ -100,8 +213,8 @@ class PriceAnalyzer:
             return 'stable'
         
         # Simple linear trend calculation
-        recent_avg = statistics.mean(prices[-7:]) if len(prices) >= 7 else statistics.mean(prices[-3:])
-        older_avg = statistics.mean(prices[:7]) if len(prices) >= 14 else statistics.mean(prices[:-3])
+        recent_avg = statistics.fmean(prices[-7:]) if len(prices) >= 7 else statistics.fmean(prices[-3:])
+        older_avg = statistics.fmean(prices[:7]) if len(prices) >= 14 else statistics.fmean(prices[:-3])
         
         change_percent = (recent_avg - older_avg) / older_avg * 100
         
@@ -114,9 +227,10 @@ class PriceAnalyzer:
     
     def _analyze_price_changes(self, items):
         """Analyze significant price changes"""
-        changes = []
+        # Only the last 10 significant changes are reported, so keep a bounded window
+        changes = deque(maxlen=10)
+        prev_price = float(items[0]['price']) if items else 0
         for i in range(1, len(items)):
-            prev_price = float(items[i-1]['price'])
             curr_price = float(items[i]['price'])
             
             if prev_price > 0:
@@ -130,8 +244,10 @@ class PriceAnalyzer:
                         'change_percent': round(change_percent, 2),
                         'change_type': 'increase' if change_percent > 0 else 'decrease'
                     })
+            
+            prev_price = curr_price
         
-        return changes[-10:]  # Return last 10 significant changes
+        return list(changes)
     
     def _recommend_buy_time(self, prices):
         """Recommend best time to buy based on patterns"""
@@ -140,11 +256,7 @@ class PriceAnalyzer:
         
         current_price = prices[-1]
         min_price = min(prices)
-        avg_price = statistics.mean(prices)
-        
-        # Calculate percentile of current price
-        sorted_prices = sorted(prices)
-        percentile = sorted_prices.index(min(sorted_prices, key=lambda x: abs(x - current_price))) / len(sorted_prices) * 100
+        avg_price = statistics.fmean(prices)
         
         if current_price <= min_price * 1.05:  # Within 5% of historical minimum
             return 'excellent_time'
@@ -170,9 +282,8 @@ class PriceAnalyzer:
         if len(prices) < 5:
             return prices[-1] if prices else 0
         
-        # Simple moving average prediction
+        # Weighted moving average prediction
         recent_prices = prices[-5:]
-        moving_avg = statistics.mean(recent_prices)
         
         # Weight more recent prices higher
         weights = [1, 1.2, 1.4, 1.6, 2.0]
@@ -180,11 +291,43 @@ class PriceAnalyzer:
         
         return round(weighted_avg, 2)
 
+class HostRateLimiter:
+    """Thread-safe per-host pacing with a random gap between requests"""
+    
+    def __init__(self, min_delay=1, max_delay=4):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._next_slot = {}
+        self._lock = threading.Lock()
+    
+    def wait(self, host):
+        """Block until the host's next free slot; other hosts are not held up"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + random.uniform(self.min_delay, self.max_delay)
+        
+        if slot > now:
+            time.sleep(slot - now)
+
 class PriceExtractor:
     """Extract prices from various e-commerce sites using BeautifulSoup"""
     
     def __init__(self):
         self.session = requests.Session()
+        # requests' default adapter keeps 10 keep-alive connections per host, which
+        # already covers the default 4 fetch workers; this only changes anything
+        # when MAX_FETCH_WORKERS is raised above 10, where the default pool would
+        # discard the extra sockets instead of reusing them
+        adapter = HTTPAdapter(pool_maxsize=max(DEFAULT_POOLSIZE, MAX_FETCH_WORKERS))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiter = HostRateLimiter()
+        # Site-specific extractors by platform; anything else uses the generic one
+        self._extractors = {
+            'amazon': self._extract_amazon_price_robust,  # tries several approaches
+            'ebay': self._extract_ebay_price
+        }
         # Rotate between different realistic user agents
         user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -199,7 +342,9 @@ class PriceExtractor:
             'User-Agent': selected_ua,
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
+            # urllib3's own list: gzip and deflate, plus br only when its brotli
+            # (or brotlicffi) import succeeded, so every advertised coding decodes
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
@@ -218,22 +363,31 @@ class PriceExtractor:
             logger.warning(f"Failed to get parameter {name}: {e}")
             return default
     
+    def _fetch_soup(self, url, headers=None, timeout=15):
+        """Fetch a page and parse it straight from the decoded response stream"""
+        response = self.session.get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+            # Read the decoded body straight off the stream, so it is never
+            # buffered a second time as response.content, and stop at the cap
+            # instead of holding an unbounded page in memory
+            body = response.raw.read(MAX_PAGE_BYTES + 1, decode_content=True)
+            if len(body) > MAX_PAGE_BYTES:
+                raise ValueError(f"Page larger than {MAX_PAGE_BYTES} bytes: {url}")
+            return BeautifulSoup(body, HTML_PARSER)
+        finally:
+            response.close()
+    
     def extract_price(self, url):
         """Extract price from URL using site-specific logic"""
         try:
             domain = urlparse(url).netloc.lower()
             
-            # Add random delay to be more human-like
-            delay = random.uniform(1, 4)
-            time.sleep(delay)
+            # Add random delay between requests to the same shop to be more human-like
+            self.rate_limiter.wait(domain)
             
-            # For Amazon, try different approaches
-            if 'amazon' in domain:
-                return self._extract_amazon_price_robust(url)
-            elif 'ebay' in domain:
-                return self._extract_ebay_price(url)
-            else:
-                return self._extract_generic_price(url)
+            extractor = self._extractors.get(detect_platform(domain), self._extract_generic_price)
+            return extractor(url)
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"Request failed for {url}: {e}")
@@ -268,20 +422,10 @@ class PriceExtractor:
         """Try mobile Amazon version (less likely to be blocked)"""
         mobile_url = url.replace('www.amazon', 'm.amazon')
         
-        response = self.session.get(mobile_url, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = self._fetch_soup(mobile_url, timeout=10)
         
-        # Mobile-specific selectors
-        mobile_selectors = [
-            '.a-price-whole',
-            '#price_inside_buybox',
-            '.a-price .a-offscreen'
-        ]
-        
-        for selector in mobile_selectors:
-            elements = soup.select(selector)
+        for selector in AMAZON_MOBILE_PRICE_SELECTORS:
+            elements = selector.select(soup)
             for element in elements:
                 price_text = element.get_text(strip=True)
                 price = self._parse_price(price_text)
@@ -300,58 +444,32 @@ class PriceExtractor:
             'Connection': 'keep-alive'
         }
         
-        response = self.session.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = self._fetch_soup(url, headers=headers, timeout=10)
         return self._extract_amazon_price_from_soup(soup)
     
     def _try_amazon_standard(self, url):
         """Standard Amazon extraction"""
-        response = self.session.get(url, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = self._fetch_soup(url, timeout=15)
         return self._extract_amazon_price_from_soup(soup)
     
     def _extract_amazon_price_from_soup(self, soup):
         """Extract price from Amazon soup with comprehensive selectors"""
-        # Comprehensive list of Amazon price selectors
-        price_selectors = [
-            '.a-price.a-text-price.a-size-medium.apexPriceToPay .a-offscreen',
-            '.a-price .a-offscreen',
-            '.a-price-whole',
-            '#price_inside_buybox',
-            '.a-price-range .a-offscreen',
-            '#apex_desktop .a-price .a-offscreen',
-            '.a-price-symbol + .a-price-whole',
-            '.a-price.a-text-price .a-offscreen',
-            '.a-offscreen',
-            '.a-price-current',
-            '[data-asin-price]',
-            '.a-price.a-text-price.a-size-medium.apexPriceToPay',
-            '.buybox-price',
-            '.header-price'
-        ]
-        
-        for selector in price_selectors:
-            elements = soup.select(selector)
+        for selector in AMAZON_PRICE_SELECTORS:
+            elements = selector.select(soup)
             for element in elements:
                 price_text = element.get_text(strip=True)
                 price = self._parse_price(price_text)
                 if price and price > 1:  # Valid price over £1
                     return price
         
-        # Try regex search in page text as last resort
-        page_text = soup.get_text()
-        price_patterns = [
-            r'£[\d,]+\.?\d*',
-            r'GBP\s*[\d,]+\.?\d*',
-            r'Price:\s*£([\d,]+\.?\d*)'
-        ]
+        # Try regex search in page text as last resort; every pattern needs a
+        # sterling marker, so pages without one skip the regex scans entirely
+        page_text = self._page_text(soup)
+        if '£' not in page_text and 'GBP' not in page_text:
+            return None
         
-        for pattern in price_patterns:
-            matches = re.findall(pattern, page_text)
+        for pattern in AMAZON_TEXT_PRICE_PATTERNS:
+            matches = pattern.findall(page_text)
             for match in matches:
                 price = self._parse_price(match)
                 if price and price > 1 and price < 10000:  # Reasonable price range
@@ -361,20 +479,10 @@ class PriceExtractor:
     
     def _extract_ebay_price(self, url):
         """Extract price from eBay product page"""
-        response = self.session.get(url, timeout=15)
-        response.raise_for_status()
+        soup = self._fetch_soup(url, timeout=15)
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        price_selectors = [
-            '.mainPrice .price',
-            '.u-flL .price',
-            '.notranslate',
-            '.display-price'
-        ]
-        
-        for selector in price_selectors:
-            elements = soup.select(selector)
+        for selector in EBAY_PRICE_SELECTORS:
+            elements = selector.select(soup)
             for element in elements:
                 price_text = element.get_text(strip=True)
                 price = self._parse_price(price_text)
@@ -386,53 +494,61 @@ class PriceExtractor:
     
     def _extract_generic_price(self, url):
         """Extract price from generic website using common patterns"""
-        response = self.session.get(url, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Common price class names and patterns
-        price_patterns = [
-            r'price',
-            r'cost',
-            r'amount',
-            r'value',
-            r'total'
-        ]
-        
-        # Look for elements with price-related classes
-        for pattern in price_patterns:
-            elements = soup.find_all(class_=re.compile(pattern, re.I))
-            for element in elements:
-                price_text = element.get_text(strip=True)
-                price = self._parse_price(price_text)
-                if price:
-                    logger.info(f"Generic price found: {price}")
-                    return price
+        soup = self._fetch_soup(url, timeout=15)
+        
+        # Look for elements with price-related classes in a single tree walk,
+        # then try them keyword by keyword in priority order
+        elements = soup.find_all(class_=PRICE_CLASS_RE)
+        elements.sort(key=self._price_class_rank)
+        for element in elements:
+            price_text = element.get_text(strip=True)
+            price = self._parse_price(price_text)
+            if price:
+                logger.info(f"Generic price found: {price}")
+                return price
         
-        # Look for currency symbols in text
-        price_regex = r'[£$€¥₹]\s*[\d,]+\.?\d*'
-        all_text = soup.get_text()
-        matches = re.findall(price_regex, all_text)
-        for match in matches:
-            price = self._parse_price(match)
+        # Look for currency symbols in text; only reached when no price
+        # element matched, and the matches are scanned lazily so the search
+        # stops at the first plausible price instead of listing every figure
+        all_text = self._page_text(soup)
+        for match in CURRENCY_PRICE_RE.finditer(all_text):
+            price = self._parse_price(match.group())
             if price and price > 1:  # Filter out small values that might not be prices
                 logger.info(f"Regex price found: {price}")
                 return price
         
         raise ValueError("No price found on generic page")
     
+    def _page_text(self, soup):
+        """Visible page text, without script/style bodies that only feed noise to the price regexes"""
+        # <noscript> is kept: pages are fetched without running JavaScript, so
+        # its content is what the page actually shows us
+        for element in soup(['script', 'style']):
+            element.decompose()
+        return soup.get_text()
+    
+    def _price_class_rank(self, element):
+        """Index of the first price keyword found in an element's classes"""
+        classes = ' '.join(element.get('class') or []).lower()
+        for rank, keyword in enumerate(PRICE_CLASS_KEYWORDS):
+            if keyword in classes:
+                return rank
+        return len(PRICE_CLASS_KEYWORDS)
+    
     def _parse_price(self, price_text):
         """Parse price from text string"""
         if not price_text:
             return None
             
-        # Remove common non-numeric characters but keep decimal points
-        price_clean = re.sub(r'[^\d.,]', '', str(price_text))
-        
-        if not price_clean:
+        # Take the first number in the text (digits with separators) in one
+        # scan, so trailing figures like "+ £3.00 postage" are not glued on
+        match = PRICE_NUMBER_RE.search(str(price_text))
+        if not match:
             return None
         
+        # Drop the group-separating spaces before the separator logic below
+        price_clean = ''.join(match.group().split())
+        
         # Handle different decimal separators
         if ',' in price_clean and '.' in price_clean:
             # Assume comma is thousands separator if both present
@@ -498,63 +614,71 @@ def get_all_products_with_analytics():
         logger.error(f"Failed to get products with analytics: {e}")
         return []
 
-def save_price_history(product_id, url, price, previous_price=None):
-    """Save price data to history table"""
+def build_price_history_item(product_id, url, price, previous_price=None, timestamp=None):
+    """Build a history table item for one price observation"""
+    item = {
+        'product_id': product_id,
+        'timestamp': timestamp or datetime.now(timezone.utc).isoformat(),
+        'price': Decimal(str(price)),
+        'url': url,
+        'ttl': int(time.time()) + (365 * 24 * 60 * 60)  # 1 year TTL
+    }
+    
+    if previous_price:
+        item['previous_price'] = Decimal(str(previous_price))
+        item['price_change'] = Decimal(str(price - previous_price))
+        item['price_change_percent'] = Decimal(str((price - previous_price) / previous_price * 100))
+    
+    return item
+
+def save_price_history_batch(items):
+    """Save many history items with batched DynamoDB writes (25 items per request); returns how many may be missing"""
     try:
-        item = {
-            'product_id': product_id,
-            'timestamp': datetime.now(timezone.utc).isoformat(),
-            'price': Decimal(str(price)),
-            'url': url,
-            'ttl': int(time.time()) + (365 * 24 * 60 * 60)  # 1 year TTL
-        }
-        
-        if previous_price:
-            item['previous_price'] = Decimal(str(previous_price))
-            item['price_change'] = Decimal(str(price - previous_price))
-            item['price_change_percent'] = Decimal(str((price - previous_price) / previous_price * 100))
-        
-        history_table.put_item(Item=item)
-        logger.info(f"Saved price history for product {product_id}: £{price}")
+        with history_table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        logger.info(f"Saved price history for {len(items)} products")
+        return 0
         
     except Exception as e:
-        logger.error(f"Failed to save price history: {e}")
+        # Earlier 25-item flushes may have landed, but none of the batch can be
+        # confirmed, so report it all as missing
+        logger.error(f"Failed to save price history batch of {len(items)} items: {e}")
+        return len(items)
 
-def check_price_alerts(product_id, current_price, previous_price, threshold=0.05):
-    """Check if price change exceeds threshold and send alert"""
+def check_price_alerts(product_id, current_price, previous_price, threshold=0.05, timestamp=None):
+    """Check if price change exceeds threshold and send alert; returns whether it did"""
     if not previous_price:
-        return
+        return False
     
     price_change_percent = abs(current_price - previous_price) / previous_price
     
     if price_change_percent >= threshold:
         try:
+            alert_type = 'decrease' if current_price < previous_price else 'increase'
+            
             # Save alert to DynamoDB
             alert_item = {
                 'alert_id': f"{product_id}_{int(time.time())}",
                 'product_id': product_id,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'timestamp': timestamp or datetime.now(timezone.utc).isoformat(),
                 'previous_price': Decimal(str(previous_price)),
                 'current_price': Decimal(str(current_price)),
                 'price_change_percent': Decimal(str(price_change_percent * 100)),
-                'alert_type': 'decrease' if current_price < previous_price else 'increase',
+                'alert_type': alert_type,
                 'ttl': int(time.time()) + (90 * 24 * 60 * 60)  # 90 days TTL
             }
             alerts_table.put_item(Item=alert_item)
             
             # Send SNS notification
-            subject = f"Price Alert: {alert_item['alert_type'].title()} for Product {product_id}"
-            message = f"""
-Price Alert!
-
-Product ID: {product_id}
-Previous Price: £{previous_price:.2f}
-Current Price: £{current_price:.2f}
-Change: {price_change_percent*100:.1f}%
-Alert Type: {alert_item['alert_type'].title()}
-
-This is an automated alert from your Price Tracker.
-            """
+            subject = f"Price Alert: {alert_type.title()} for Product {product_id}"
+            message = ALERT_MESSAGE_TEMPLATE.format(
+                product_id=product_id,
+                previous_price=previous_price,
+                current_price=current_price,
+                change_percent=price_change_percent * 100,
+                alert_type=alert_type.title()
+            )
             
             # Get SNS topic ARN (assuming it's set in environment or parameter store)
             topic_arn = os.environ.get('SNS_TOPIC_ARN')
@@ -568,6 +692,10 @@ This is an automated alert from your Price Tracker.
             
         except Exception as e:
             logger.error(f"Failed to send alert: {e}")
+        
+        return True
+    
+    return False
 
 def send_cloudwatch_metrics(metric_name, value, unit='Count'):
     """Send custom metrics to CloudWatch"""
@@ -615,13 +743,11 @@ def handle_web_api_request(event, context):
     try:
         path = event.get('path', '')
         method = event.get('httpMethod', 'GET')
+        # API Gateway sends null rather than {} when there is no query string
+        product_id = (event.get('queryStringParameters') or {}).get('product_id')
         
         # Enable CORS
-        headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS'
-        }
+        headers = CORS_HEADERS
         
         if method == 'OPTIONS':
             return {
@@ -641,7 +767,6 @@ def handle_web_api_request(event, context):
         
         elif path == '/analytics' and method == 'GET':
             # Get analytics for specific product
-            product_id = event.get('queryStringParameters', {}).get('product_id')
             if product_id:
                 analytics = get_product_analytics(product_id)
                 return {
@@ -652,20 +777,12 @@ def handle_web_api_request(event, context):
         
         elif path == '/history' and method == 'GET':
             # Get price history for specific product
-            product_id = event.get('queryStringParameters', {}).get('product_id')
             if product_id:
                 # Get last 30 days of history
-                cutoff_date = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
-                response = history_table.query(
-                    KeyConditionExpression=boto3.dynamodb.conditions.Key('product_id').eq(product_id),
-                    FilterExpression=boto3.dynamodb.conditions.Attr('timestamp').gte(cutoff_date),
-                    ScanIndexForward=True
-                )
-                
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps(response.get('Items', []), default=str)
+                    'body': json.dumps(query_price_history(product_id, 30), default=str)
                 }
         
         return {
@@ -678,7 +795,7 @@ def handle_web_api_request(event, context):
         logger.error(f"Web API request failed: {e}")
         return {
             'statusCode': 500,
-            'headers': headers,
+            'headers': CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         }
 
@@ -699,21 +816,41 @@ def handle_price_tracking(event, context):
                 'body': json.dumps({'message': 'No products to track'})
             }
         
+        # Stamp every record written by this run with the same batch timestamp
+        run_timestamp = datetime.now(timezone.utc).isoformat()
+        
+        # The alert threshold is run-wide, so read it from Parameter Store once
+        threshold = float(extractor.get_parameter('/price-tracker/alerts/price-change-threshold', '0.05'))
+        
         # Track prices
         successful_tracks = 0
         failed_tracks = 0
         alerts_sent = 0
-        
-        for product in products:
+        history_errors = 0
+        history_items = []
+        
+        # Fetch prices concurrently since each product is dominated by network
+        # waits; DynamoDB writes below stay on the handler thread. Products that
+        # share a URL share one fetch.
+        price_futures = []
+        url_futures = {}
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            for product in products:
+                url = product.get('url')
+                logger.info(f"Tracking product {product.get('product_id', 'unknown')}: {url}")
+                if url not in url_futures:
+                    url_futures[url] = executor.submit(extractor.extract_price, url)
+                price_futures.append(url_futures[url])
+        
+        for product, price_future in zip(products, price_futures):
             try:
                 product_id = product['product_id']
                 url = product['url']
-                previous_price = float(product.get('last_price', 0)) if product.get('last_price') else None
-                
-                logger.info(f"Tracking product {product_id}: {url}")
+                last_price = product.get('last_price')
+                previous_price = float(last_price) if last_price else None
                 
                 # Extract current price
-                current_price = extractor.extract_price(url)
+                current_price = price_future.result()
                 
                 # Update product with latest price
                 products_table.update_item(
@@ -721,20 +858,16 @@ def handle_price_tracking(event, context):
                     UpdateExpression='SET last_price = :price, last_updated = :timestamp',
                     ExpressionAttributeValues={
                         ':price': Decimal(str(current_price)),
-                        ':timestamp': datetime.now(timezone.utc).isoformat()
+                        ':timestamp': run_timestamp
                     }
                 )
                 
-                # Save to history
-                save_price_history(product_id, url, current_price, previous_price)
+                # Queue for the batched history write after the loop
+                history_items.append(build_price_history_item(product_id, url, current_price, previous_price, run_timestamp))
                 
                 # Check for alerts
-                threshold = float(extractor.get_parameter('/price-tracker/alerts/price-change-threshold', '0.05'))
-                if previous_price:
-                    price_change_percent = abs(current_price - previous_price) / previous_price
-                    if price_change_percent >= threshold:
-                        check_price_alerts(product_id, current_price, previous_price, threshold)
-                        alerts_sent += 1
+                if check_price_alerts(product_id, current_price, previous_price, threshold, run_timestamp):
+                    alerts_sent += 1
                 
                 successful_tracks += 1
                 logger.info(f"Successfully tracked {product_id}: £{current_price:.2f}")
@@ -743,9 +876,15 @@ def handle_price_tracking(event, context):
                 failed_tracks += 1
                 logger.error(f"Failed to track product {product.get('product_id', 'unknown')}: {e}")
         
+        # Save to history
+        if history_items:
+            history_errors = save_price_history_batch(history_items)
+        
         # Send CloudWatch metrics
         send_cloudwatch_metrics('ProductsTracked', successful_tracks)
-        send_cloudwatch_metrics('TrackingErrors', failed_tracks)
+        # Products whose history was not saved count as errors too, since their
+        # last_price has already moved on and the history now has a gap
+        send_cloudwatch_metrics('TrackingErrors', failed_tracks + history_errors)
         send_cloudwatch_metrics('AlertsSent', alerts_sent)
         
         result = {
@@ -754,12 +893,13 @@ def handle_price_tracking(event, context):
                 'message': 'Price tracking completed',
                 'products_tracked': successful_tracks,
                 'tracking_errors': failed_tracks,
+                'history_write_errors': history_errors,
                 'alerts_sent': alerts_sent,
                 'timestamp': datetime.now(timezone.utc).isoformat()
             })
         }
         
-        logger.info(f"Price tracking completed: {successful_tracks} successful, {failed_tracks} failed")
+        logger.info(f"Price tracking completed: {successful_tracks} successful, {failed_tracks} failed, {history_errors} history writes failed")
         return result
         
     except Exception as e: